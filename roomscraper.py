@@ -1,32 +1,34 @@
 import time
 import aiohttp
-from bs4 import BeautifulSoup
+from selectolax.lexbor import LexborHTMLParser
 import discord
-from dotenv import dotenv_values
+from discord.ext import commands
 import asyncio
+from bisect import bisect_right
 from datetime import datetime
+from functools import lru_cache
 import os
 import json
+import pickle
 import re
 
 
-# Load configuration from .env file
-config = dotenv_values(".env")
-
-from discord.ext import commands
-
 intents = discord.Intents.default()
 intents.message_content = True
 
-# Discord bot token and target user ID
-TOKEN = config["DISCORD_TOKEN"]
-TARGET_USER_ID = int(config["TARGET_USER_ID"])
-
 bot = commands.Bot(command_prefix='!', intents=intents)
 
 # URL to scrape for course information
 course_schedule_url = "https://web.csulb.edu/depts/enrollment/registration/class_schedule/Spring_2024/By_Subject/"
-room_bookings = []
+# Rooms keyed by location so sections can find their room in O(1)
+room_bookings = {}
+
+# Matches one day abbreviation at a time: a capital letter plus any
+# lowercase letters that follow it (e.g. "TuTh" -> ["Tu", "Th"])
+_DAYS_RE = re.compile(r'[A-Z][^A-Z]*')
+
+# Captures (hours, minutes, am/pm) from strings like "9", "9:50", "12:30pm"
+_TIME_RE = re.compile(r'(\d{1,2})(?::(\d{2}))?\s*([ap]m)?', re.I)
 
 WEEKDAY_ABBR = {
     0: "M",
@@ -55,37 +57,30 @@ def parse_sections_table(table):
     Parses the HTML table of course sections and returns detailed information.
 
     Args:
-        table (Tag): The BeautifulSoup object of the HTML table to be parsed.
+        table (Node): The selectolax node of the HTML table to be parsed.
 
     Returns:
-        list[dict]: List of dictionaries containing section details.
+        list[tuple]: (location, day, start, end) tuples, one per meeting day.
     """
-    sections = []
-    headers = [th.text.strip() for th in table.find_all('th', scope='col')]
-    
-    for row in table.find_all('tr')[1:]:  # Skipping the header row
-        cells = row.find_all(['th', 'td'])
-        section_info = {headers[i]: cells[i].get_text(strip=True) for i in range(len(cells))}
-        sections.append(section_info)
+    headers = [th.text(strip=True) for th in table.css('th[scope="col"]')]
+    col_idx = {header: i for i, header in enumerate(headers)}
+    days_col, time_col, location_col = col_idx['DAYS'], col_idx['TIME'], col_idx['LOCATION']
 
     formatted = []
-    for section in sections:
+    for row in table.css('tr')[1:]:  # Skipping the header row
+        cells = row.css('th, td')
 
-        start_time, end_time = parse_times(section['TIME'])
-        if section['DAYS'] == 'TBA' or section['DAYS'] == 'NA':
+        days = cells[days_col].text(strip=True)
+        if days == 'TBA' or days == 'NA':
             continue
-        for day in parse_days(section['DAYS']):
-            formatted_section = {
-                "Location": section['LOCATION'],
-                "Day": day,
-                "Start": start_time,
-                "End": end_time
-            }
-
-        formatted.append(formatted_section)
+        start_time, end_time = parse_times(cells[time_col].text(strip=True))
+        location = cells[location_col].text(strip=True)
+        for day in parse_days(days):
+            formatted.append((location, day, start_time, end_time))
 
     return formatted
 
+@lru_cache(maxsize=4096)
 def parse_times(time_str):
     # Handle 'TBA' or 'NA' cases upfront
     if time_str == 'TBA' or time_str == 'NA':
@@ -109,102 +104,196 @@ def parse_times(time_str):
 
     return (start_time, end_time)
 
+@lru_cache(maxsize=4096)
 def time_to_24h(t_str):
-    t_str = t_str.lower()
-    is_pm = 'pm' in t_str
-    t_str = t_str.replace('am', '').replace('pm', '')
-
-    if ':' in t_str:
-        hours, minutes = t_str.split(':')
-    else:
-        hours, minutes = t_str, '00'
-
-    hours, minutes = int(hours), int(minutes)
-
-    if is_pm and hours < 12:
-        hours += 12
-    elif not is_pm and hours == 12:
-        hours = 0
-
-    return (hours * 100) + minutes
-
+    # Tokenize once instead of repeated lower/replace/split passes
+    m = _TIME_RE.match(t_str.strip())
+    hours = int(m[1])
+    minutes = int(m[2] or 0)
+    ampm = (m[3] or '').lower()
+
+    if not ampm:
+        return (hours * 100) + minutes
+    return ((hours % 12) + 12 * (ampm == 'pm')) * 100 + minutes
+
+def format_hhmm(hhmm):
+    # e.g. 1330 -> "1:30pm" without a strptime/strftime round trip
+    hours, minutes = divmod(hhmm, 100)
+    suffix = 'am' if hours < 12 else 'pm'
+    return f"{hours % 12 or 12}:{minutes:02d}{suffix}"
+
+@lru_cache(maxsize=4096)
 def parse_days(days_str):
     # split string by capital letters
-    return [day for day in re.findall('[A-Z][^A-Z]*', days_str)]
-
-async def get_page_html(url):
+    return _DAYS_RE.findall(days_str)
+
+# Shared HTTP session, created lazily so it binds to the bot's event loop
+# and keeps its pooled connections alive across scrapes
+_session = None
+
+async def _get_session():
+    global _session
+    if _session is None or _session.closed:
+        connector = aiohttp.TCPConnector(limit_per_host=10, ttl_dns_cache=300,
+                                         keepalive_timeout=60, enable_cleanup_closed=True)
+        _session = aiohttp.ClientSession(connector=connector,
+                                         timeout=aiohttp.ClientTimeout(total=30),
+                                         headers={'Accept-Encoding': 'gzip, deflate'})
+    return _session
+
+async def get_page_html(session, url):
     """
-    Asynchronously fetches course sections from a specified URL and processes the data.
+    Asynchronously fetches a page and parses it with selectolax.
 
     Args:
+        session (aiohttp.ClientSession): The shared session to fetch with.
         url (str): The URL to scrape.
-        course_title (str): The title of the course to look for.
 
     Returns:
-        A list of section information if successful, an empty list otherwise.
+        A LexborHTMLParser tree if successful, an empty list otherwise.
     """
-    async with aiohttp.ClientSession() as session:
-        async with session.get(url) as response:
-            if response.status != 200:
-                # Log failure
-                print("Failed to retrieve the web page.")
-                return []
+    async with session.get(url) as response:
+        if response.status != 200:
+            # Log failure
+            print("Failed to retrieve the web page.")
+            return []
+
+        # Hand the raw bytes straight to the C parser; decoding to str
+        # first would just copy the document an extra time
+        tree = LexborHTMLParser(await response.read())
+    return tree
+
+async def bounded_gather(coros, limit=10):
+    """
+    Runs coroutines concurrently, but at most `limit` at a time so we
+    don't hammer csulb.edu.
 
-            soup = BeautifulSoup(await response.text(), 'html.parser')
-    return soup
+    Args:
+        coros (list): The coroutines to run.
+        limit (int): Maximum number of coroutines running at once.
 
-def get_subjects(html):
+    Returns:
+        list: The results, in the same order as the input coroutines.
+    """
+    semaphore = asyncio.Semaphore(limit)
 
-    toplink_divs = html.find_all('div', class_='indexList')
+    async def bounded(coro):
+        async with semaphore:
+            return await coro
 
-    hrefs = []
-    # Iterate over each 'toplink' div
-    for div in toplink_divs:
-        # Find all <a> tags within the div
-        links = div.find_all('a')
-        # Extract the href attribute from each link and add it to the list
-        for link in links:
-            if link.get('href') != None and link.get('href') != "#":
-                hrefs.append(link.get('href'))
+    return await asyncio.gather(*(bounded(coro) for coro in coros))
 
-    return hrefs
+def get_subjects(html):
+    # Extract the href attribute from every link inside the index lists
+    return [a.attributes.get('href') for a in html.css('div.indexList a')
+            if a.attributes.get('href') not in (None, "#")]
 
 class Room:
-    def __init__(self, location, booked_times=None):
+    # No per-instance __dict__; thousands of rooms get created per scrape
+    __slots__ = ('location', 'by_day', '_starts')
+
+    def __init__(self, location, by_day=None):
         self.location = location
-        # Ensure booked_times is a list of tuples, each tuple containing (day, (start, end))
-        self.booked_times = booked_times if booked_times is not None else []
+        # Booked (start, end) tuples grouped by day abbreviation
+        self.by_day = by_day if by_day is not None else {}
+        # Per-day start times, rebuilt by finalize() for binary searching
+        self._starts = {}
 
     def add_booked_time(self, day, time_tuple):
-        # Now each booked_time is a tuple of (day, (start, end))
-        self.booked_times.append((day, time_tuple))
+        self.by_day.setdefault(day, []).append(time_tuple)
+
+    def finalize(self):
+        # Sort each day's intervals by start time, then coalesce any that
+        # overlap or nest (cross-listed sections book the same room twice);
+        # with disjoint intervals the bisect in is_open is exact
+        for day, times in self.by_day.items():
+            times.sort()
+            merged = []
+            for start, end in times:
+                if merged and start <= merged[-1][1]:
+                    if end > merged[-1][1]:
+                        merged[-1] = (merged[-1][0], end)
+                else:
+                    merged.append((start, end))
+            self.by_day[day] = merged
+            self._starts[day] = [start for start, _ in merged]
+
+    def next_start_after(self, day, current_time):
+        # First booked start strictly after current_time, or 2400 if the
+        # room stays free for the rest of the day
+        starts = self._starts.get(day, ())
+        i = bisect_right(starts, current_time)
+        return starts[i] if i < len(starts) else 2400
 
     def is_open(self, day, current_time):
-        for booked_day, (start, end) in self.booked_times:
-            if day == booked_day:
-                if start <= current_time <= end:
-                    return False
-        return True
-    
+        # Bisect to the last interval starting at or before current_time;
+        # the room is busy only if that interval is still running
+        times = self.by_day.get(day)
+        if not times:
+            return True
+        i = bisect_right(times, (current_time, 10**9)) - 1
+        return not (i >= 0 and times[i][0] <= current_time <= times[i][1])
+
     def __str__(self):
         return self.location
     
-def get_rooms(html):
-    courses = html.find_all(lambda tag: tag.name == "div" and tag.get("class", []) == ["courseHeader"])
-    for course_header in courses:
-        if course_header:
-            sections_table = course_header.find_next_sibling('table')
-            if sections_table:
-                sections = parse_sections_table(sections_table)
-                for section in sections:
-                    # check if room is already in rooms
-                    for room in room_bookings:
-                        if room.location == section['Location']:
-                            room.add_booked_time(section['Day'], (section['Start'], section['End']))
-                            break
-                    else:
-                        room = Room(section['Location'], [(section['Day'], (section['Start'], section['End']))])
-                        room_bookings.append(room)
+def get_sections(html):
+    # The adjacent-sibling selector pairs each course header with its
+    # sections table in a single C-side pass
+    return [section
+            for sections_table in html.css('div.courseHeader + table')
+            for section in parse_sections_table(sections_table)]
+
+def add_sections(sections):
+    for location, day, start, end in sections:
+        # check if room is already in rooms
+        room = room_bookings.get(location)
+        if room is None:
+            room = room_bookings[location] = Room(location)
+        room.add_booked_time(day, (start, end))
+
+async def get_subject_sections(session, url, etags, pages_cache):
+    """
+    Fetches one subject page and returns its parsed section tuples.
+
+    Sends a conditional GET when we hold cache validators for the URL;
+    on 304 the previously parsed sections are reused with no download
+    or parse cost.
+
+    Args:
+        session (aiohttp.ClientSession): The shared session to fetch with.
+        url (str): The subject page URL.
+        etags (dict): url -> (etag, last_modified) validators, updated in place.
+        pages_cache (dict): url -> parsed sections, updated in place.
+
+    Returns:
+        list[tuple]: (location, day, start, end) tuples for the page.
+    """
+    headers = {}
+    # Only offer validators when we hold the page to replay on a 304;
+    # otherwise a stale etags file would turn unchanged subjects into
+    # silently empty section lists
+    if url in pages_cache:
+        etag, last_modified = etags.get(url, (None, None))
+        if etag:
+            headers['If-None-Match'] = etag
+        if last_modified:
+            headers['If-Modified-Since'] = last_modified
+
+    async with session.get(url, headers=headers) as response:
+        if response.status == 304:
+            return pages_cache.get(url, [])
+        if response.status != 200:
+            # Log failure
+            print("Failed to retrieve the web page.")
+            return []
+        body = await response.read()
+
+    sections = get_sections(LexborHTMLParser(body))
+    if response.headers.get('ETag') or response.headers.get('Last-Modified'):
+        etags[url] = (response.headers.get('ETag'), response.headers.get('Last-Modified'))
+        pages_cache[url] = sections
+    return sections
             
 @bot.command()
 async def findroom(ctx, arg1 = None, *args):
@@ -239,33 +328,70 @@ async def findroom(ctx, arg1 = None, *args):
         
 
 
-    rooms_data_file = "rooms_data.json"  # Name of the file to check/save to
-    
-    # Check if the rooms data file exists
-    if not os.path.exists(rooms_data_file):
-        print("Scraping rooms because no saved data file found...")
-        ctx.reply("Scraping rooms because no saved data file found... Please wait.")
-        subjects_page = await get_page_html(course_schedule_url)
-        subjects = get_subjects(subjects_page)
-        for subject in subjects:
-            course_list = await get_page_html(course_schedule_url + subject)
-            get_rooms(course_list)
-        
-        # Save rooms data to file
-        with open(rooms_data_file, 'w') as file:
-            # Convert the rooms list of Room objects to a list of dicts for JSON serialization
-            rooms_dicts = [{'location': room.location, 'booked_times': room.booked_times} for room in room_bookings]
-            json.dump(rooms_dicts, file)
-    else:
+    rooms_data_file = "rooms_data.pkl"  # Binary cache of the scraped rooms dict
+    legacy_json_file = "rooms_data.json"  # Older JSON cache, still loadable
+    etags_file = "rooms_etags.json"  # url -> (etag, last_modified) validators
+    pages_cache_file = "rooms_pages.pkl"  # url -> parsed sections for 304 replays
+
+    # Check if a rooms data file exists
+    if os.path.exists(rooms_data_file):
         print("Loading rooms from saved data file...")
+        # Unpickling restores the whole dict of Room objects in one shot
+        with open(rooms_data_file, 'rb') as file:
+            room_bookings.clear()  # Ensure rooms dict is empty before loading
+            room_bookings.update(pickle.load(file))
+    elif os.path.exists(legacy_json_file):
+        print("Loading rooms from legacy JSON data file...")
         # Load rooms data from file
-        with open(rooms_data_file, 'r') as file:
+        with open(legacy_json_file, 'r') as file:
             rooms_dicts = json.load(file)
-            # Convert list of dicts back to list of Room objects
-            room_bookings.clear()  # Ensure rooms list is empty before loading
+            # Convert list of dicts back to Room objects
+            room_bookings.clear()  # Ensure rooms dict is empty before loading
             for room_dict in rooms_dicts:
-                room = Room(room_dict['location'], room_dict['booked_times'])
-                room_bookings.append(room)
+                if 'by_day' in room_dict:
+                    by_day = room_dict['by_day']
+                else:
+                    # Older cache files stored a flat (day, (start, end)) list
+                    by_day = {}
+                    for day, times in room_dict['booked_times']:
+                        by_day.setdefault(day, []).append(times)
+                # JSON turns tuples into lists; restore tuples and sort order
+                by_day = {day: sorted(tuple(t) for t in times) for day, times in by_day.items()}
+                room = Room(room_dict['location'], by_day)
+                room.finalize()
+                room_bookings[room.location] = room
+    else:
+        print("Scraping rooms because no saved data file found...")
+        ctx.reply("Scraping rooms because no saved data file found... Please wait.")
+        # Cache validators and parsed pages from any previous scrape let
+        # unchanged subjects come back as bodyless 304s
+        etags = {}
+        pages_cache = {}
+        if os.path.exists(etags_file):
+            with open(etags_file, 'r') as file:
+                etags = {url: tuple(validators) for url, validators in json.load(file).items()}
+        if os.path.exists(pages_cache_file):
+            with open(pages_cache_file, 'rb') as file:
+                pages_cache = pickle.load(file)
+
+        session = await _get_session()
+        subjects_page = await get_page_html(session, course_schedule_url)
+        subjects = get_subjects(subjects_page)
+        tasks = [get_subject_sections(session, course_schedule_url + subject, etags, pages_cache)
+                 for subject in subjects]
+        section_lists = await bounded_gather(tasks)
+        for sections in section_lists:
+            add_sections(sections)
+        for room in room_bookings.values():
+            room.finalize()
+
+        # Save rooms data to file, plus the validators/pages for next refresh
+        with open(rooms_data_file, 'wb') as file:
+            pickle.dump(room_bookings, file, protocol=5)
+        with open(etags_file, 'w') as file:
+            json.dump(etags, file)
+        with open(pages_cache_file, 'wb') as file:
+            pickle.dump(pages_cache, file, protocol=5)
 
 
     # get current time in 24 hour format
@@ -277,7 +403,7 @@ async def findroom(ctx, arg1 = None, *args):
     if filter:
         print(f"Filtering for locations containing '{filter.upper()}'...")
     open_rooms = []
-    for room in room_bookings:
+    for room in room_bookings.values():
         if room.is_open(current_day, current_time):
             if filter:
                 if filter.lower() in room.location.lower():
@@ -285,29 +411,27 @@ async def findroom(ctx, arg1 = None, *args):
             else:
                 open_rooms.append(room)
 
-    formatted_open_rooms = {}
-
     full_string = "All currently open rooms:\n\n"
-    
+
+    # Track the best (latest) next-use time and its rooms in the same pass
+    max_value = -1
+    keys_with_max_value = []
+
     for room in open_rooms:
         # get the next time the room will be in use:
-        last_start = 2400
-        for day, (start, end) in room.booked_times:
-            if start > current_time:
-                if start < last_start:
-                    last_start = start
-        
-        formatted_open_rooms[room.location] = last_start
-        full_string += f"{room} until __{datetime.strptime(str(last_start), '%H%M').strftime('%-I:%M%p').lower() if last_start != 2400 else 'end of the day'}__\n"
+        last_start = room.next_start_after(current_day, current_time)
 
-    if formatted_open_rooms == {}:
+        if last_start > max_value:
+            max_value = last_start
+            keys_with_max_value = [room.location]
+        elif last_start == max_value:
+            keys_with_max_value.append(room.location)
+        full_string += f"{room} until __{format_hhmm(last_start) if last_start != 2400 else 'end of the day'}__\n"
+
+    if not keys_with_max_value:
         await ctx.reply("__**No open rooms found that meet your filters.**__")
         return
-    
-    max_value = max(formatted_open_rooms.values())
-
-    keys_with_max_value = [key for key, value in formatted_open_rooms.items() if value == max_value]
-    reply = f"Best rooms (open until __{datetime.strptime(str(max_value), '%H%M').strftime('%-I:%M%p').lower() if max_value != 2400 else 'end of the day'}__):**\n\_\_\_\_\_\_\_\_\_\_\_\n\n" + "\n".join(keys_with_max_value) + "\n\_\_\_\_\_\_\_\_\_\_\_**\n\n"
+    reply = f"Best rooms (open until __{format_hhmm(max_value) if max_value != 2400 else 'end of the day'}__):**\n\_\_\_\_\_\_\_\_\_\_\_\n\n" + "\n".join(keys_with_max_value) + "\n\_\_\_\_\_\_\_\_\_\_\_**\n\n"
     
     if full:
         reply += full_string
@@ -325,4 +449,16 @@ async def on_ready():
     print(f'{bot.user} is now running')
     await send_message(TARGET_USER_ID, "Bot has been started.")
 
-bot.run(TOKEN)
\ No newline at end of file
+if __name__ == '__main__':
+    # Only the running bot needs dotenv and the .env secrets; importing
+    # this module for the scraper helpers shouldn't touch either
+    from dotenv import dotenv_values
+
+    # Load configuration from .env file
+    config = dotenv_values(".env")
+
+    # Discord bot token and target user ID
+    TOKEN = config["DISCORD_TOKEN"]
+    TARGET_USER_ID = int(config["TARGET_USER_ID"])
+
+    bot.run(TOKEN)
\ No newline at end of file